@@ -25,13 +25,14 @@ Features configured:
 """
 
 import os
+import time
+import asyncio
 import pyaudio
-import queue
+import numpy as np
 from dotenv import load_dotenv
 
-from google.cloud.speech_v2 import SpeechClient
+from google.cloud.speech_v2.services.speech.transports import SpeechGrpcAsyncIOTransport
 from google.cloud.speech_v2.types import cloud_speech
-from google.api_core.client_options import ClientOptions
 from google.protobuf.duration_pb2 import Duration
 
 # Load environment variables
@@ -42,23 +43,128 @@ REGION = "us"  # Chirp 3 is available in 'us' region (global endpoint usually re
 if not PROJECT_ID:
     raise ValueError("GOOGLE_CLOUD_PROJECT not found in .env file or environment.")
 
+# gRPC channel tuning for the streaming connection: keepalive pings keep it
+# warm and surface dead links quickly, so final results are not held up.
+SPEECH_ENDPOINT = f"{REGION}-speech.googleapis.com"
+GRPC_CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 10000),
+    ("grpc.keepalive_timeout_ms", 5000),
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.max_receive_message_length", -1),
+]
+
+# Set STT_DEBUG=1 to print audio flow / raw response diagnostics
+DEBUG = bool(os.getenv("STT_DEBUG"))
+
 # Audio configuration
 FORMAT = pyaudio.paInt16
 CHANNELS = 1
 SAMPLE_RATE = 16000
-CHUNK_SIZE = 1024
+# Frames per PortAudio buffer; larger buffers mean fewer callbacks and requests.
+# Override with STT_CHUNK_SIZE to tune per platform (must be a power of two).
+CHUNK_SIZE = int(os.getenv("STT_CHUNK_SIZE", "2048"))
+if CHUNK_SIZE <= 0 or CHUNK_SIZE & (CHUNK_SIZE - 1):
+    raise ValueError("STT_CHUNK_SIZE must be a power of two.")
+
+# Coalesce microphone chunks so each streaming request carries at least
+# ~100 ms of audio, waiting at most MAX_SEND_WAIT_S for more to arrive.
+MIN_SEND_BYTES = SAMPLE_RATE // 10 * CHANNELS * pyaudio.get_sample_size(FORMAT)
+MAX_SEND_WAIT_S = 0.1
+MAX_SEND_BYTES = 25600  # Speech-to-Text V2 limit for the audio in a single request
+
+# Client-side voice activity gate: silent audio is not uploaded. Silence is still
+# sent for VAD_HANGOVER_S after speech so speech_end_timeout (2 s) can finalize the
+# utterance, and one chunk goes through every VAD_KEEPALIVE_S so the stream is not
+# closed for lack of audio.
+VAD_RMS_THRESHOLD = 300  # int16 RMS of a 20 ms frame considered speech
+VAD_FRAME_SAMPLES = SAMPLE_RATE // 50 * CHANNELS
+VAD_HANGOVER_S = 2.5
+VAD_KEEPALIVE_S = 5.0
+BYTES_PER_SECOND = SAMPLE_RATE * CHANNELS * pyaudio.get_sample_size(FORMAT)
+
+# Minimum time between interim result writes; finals are always printed immediately
+INTERIM_PRINT_INTERVAL_S = 0.1
+
+# Recognition configuration (constant, so built once at import)
+RECOGNIZER = f"projects/{PROJECT_ID}/locations/{REGION}/recognizers/_"
+
+RECOGNITION_CONFIG = cloud_speech.RecognitionConfig(
+    # IMPORTANT: We must use ExplicitDecodingConfig for raw microphone audio.
+    # AutoDetectDecodingConfig fails because raw PCM (LINEAR16) has no header 
+    # (unlike WAV), so the API cannot auto-detect format and hangs.
+    explicit_decoding_config=cloud_speech.ExplicitDecodingConfig(
+        encoding=cloud_speech.ExplicitDecodingConfig.AudioEncoding.LINEAR16,
+        sample_rate_hertz=SAMPLE_RATE,
+        audio_channel_count=CHANNELS,
+    ),
+    language_codes=["pt-BR"], # Portuguese (Brazil)
+    model="chirp_3",
+)
+
+STREAMING_CONFIG = cloud_speech.StreamingRecognitionConfig(
+    config=RECOGNITION_CONFIG,
+    streaming_features=cloud_speech.StreamingRecognitionFeatures(
+        # interim_results: Returns partial transcripts (is_final=False) as you speak.
+        # Critical for user feedback so they know the system is listening.
+        interim_results=True, 
+
+        # enable_voice_activity_events: Returns events when speech starts/ends.
+        enable_voice_activity_events=True,
+
+        # voice_activity_timeout: SOLVES CHIRP 3 LATENCY ISSUE.
+        # Chirp 3 can be slow to finalize short utterances (like "Tudo").
+        # Setting speech_end_timeout forces the model to finalize the result 
+        # if it detects silence for X seconds (here 2s), preventing 10s+ delays.
+        # We use a dictionary because the VoiceActivityTimeout class might not 
+        # be directly exposed in all library versions.
+        voice_activity_timeout={
+            "speech_end_timeout": {"seconds": 2}
+        }
+    ),
+)
+
+# Config request sent first on every stream, already serialized
+CONFIG_REQUEST = cloud_speech.StreamingRecognizeRequest.serialize(
+    cloud_speech.StreamingRecognizeRequest(
+        recognizer=RECOGNIZER,
+        streaming_config=STREAMING_CONFIG,
+    )
+)
+
+# The streaming call is made on the raw channel with pre-serialized requests: the
+# config request never changes, and an audio request is nothing but the audio
+# field's tag and length prefix followed by the raw bytes.
+STREAMING_RECOGNIZE_METHOD = "/google.cloud.speech.v2.Speech/StreamingRecognize"
+
+def _varint(value):
+    """Encodes a non-negative int as a protobuf varint."""
+    out = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+_AUDIO_FIELD = cloud_speech.StreamingRecognizeRequest.pb().DESCRIPTOR.fields_by_name["audio"]
+_AUDIO_TAG = _varint(_AUDIO_FIELD.number << 3 | 2)  # Wire type 2: length-delimited
+
+def encode_audio_request(chunk):
+    """Serializes a StreamingRecognizeRequest carrying only the audio field."""
+    return b"".join((_AUDIO_TAG, _varint(len(chunk)), chunk))
 
 class MicrophoneStream:
-    """Opens a recording stream as a generator yielding the audio chunks."""
+    """Opens a recording stream as an async generator yielding the audio chunks."""
 
     def __init__(self, rate, chunk, device_index=None):
         self._rate = rate
         self._chunk = chunk
         self._device_index = device_index
-        self._buff = queue.Queue()
+        self._buff = asyncio.Queue()
         self.closed = True
 
     def __enter__(self):
+        # The PortAudio callback runs on its own thread and hands chunks to this loop
+        self._loop = asyncio.get_running_loop()
         self._audio_interface = pyaudio.PyAudio()
         self._audio_stream = self._audio_interface.open(
             format=FORMAT,
@@ -76,37 +182,84 @@ class MicrophoneStream:
         self._audio_stream.stop_stream()
         self._audio_stream.close()
         self.closed = True
-        self._buff.put(None)
+        self._buff.put_nowait(None)
         self._audio_interface.terminate()
 
     def _fill_buffer(self, in_data, frame_count, time_info, status_flags):
         """Continuously collect data from the audio stream, into the buffer."""
-        self._buff.put(in_data)
+        self._loop.call_soon_threadsafe(self._buff.put_nowait, in_data)
         return None, pyaudio.paContinue
 
-    def generator(self):
+    def _drain(self, buf):
+        """Moves every buffered chunk into buf. Returns False once the stream has ended."""
+        for _ in range(self._buff.qsize()):
+            chunk = self._buff.get_nowait()
+            if chunk is None:
+                return False
+            buf += chunk
+        return True
+
+    async def generator(self):
+        # Reused across iterations so each flush costs a single bytes() copy
+        # instead of a list, a join and a fresh bytes object.
+        buf = bytearray()
         while not self.closed:
-            # Use a blocking get() to ensure there's at least one chunk of
-            # data, and stop iteration if the chunk is None, indicating the
-            # end of the audio stream.
-            chunk = self._buff.get()
+            # Wait for at least one chunk of data, and stop iteration if the
+            # chunk is None, indicating the end of the audio stream.
+            chunk = await self._buff.get()
             if chunk is None:
                 return
-            data = [chunk]
+            buf.clear()
+            buf += chunk
+            if not self._drain(buf):
+                return
 
-            # Now consume whatever other data's still buffered.
-            while True:
+            # Wait briefly for more audio until the minimum request size is reached.
+            while len(buf) < MIN_SEND_BYTES:
                 try:
-                    chunk = self._buff.get(block=False)
-                    if chunk is None:
-                        return
-                    data.append(chunk)
-                except queue.Empty:
+                    chunk = await asyncio.wait_for(self._buff.get(), MAX_SEND_WAIT_S)
+                except asyncio.TimeoutError:
                     break
-            
-            # Optional debug: print dot for every chunk to verify audio flow
-            print(".", end="", flush=True)
-            yield b"".join(data)
+                if chunk is None:
+                    return
+                buf += chunk
+
+            if DEBUG:
+                # Print dot for every flush to verify audio flow
+                print(".", end="", flush=True)
+            # A backlog (e.g. after a network stall) may exceed the request size limit
+            with memoryview(buf) as view:
+                for offset in range(0, len(view), MAX_SEND_BYTES):
+                    yield bytes(view[offset:offset + MAX_SEND_BYTES])
+
+def is_speech(chunk):
+    """Returns True if any 20 ms frame of the int16 chunk is above the energy threshold."""
+    samples = np.frombuffer(chunk, dtype=np.int16).astype(np.float32)
+    frame = min(VAD_FRAME_SAMPLES, len(samples))
+    usable = len(samples) - len(samples) % frame
+    energy = np.mean(np.square(samples[:usable].reshape(-1, frame)), axis=1)
+    return bool((energy >= VAD_RMS_THRESHOLD ** 2).any())
+
+async def voice_gate(audio_chunks):
+    """Drops silent chunks, keeping enough around speech for Chirp's endpointing."""
+    silence_s = 0.0  # Silence since the last speech
+    skipped_s = 0.0  # Audio dropped since the last chunk sent
+    held = None  # Last dropped chunk, sent ahead of speech so onsets aren't clipped
+    async for chunk in audio_chunks:
+        duration = len(chunk) / BYTES_PER_SECOND
+        if is_speech(chunk):
+            silence_s = 0.0
+            if held is not None:
+                yield held
+        else:
+            silence_s += duration
+            if silence_s > VAD_HANGOVER_S and skipped_s < VAD_KEEPALIVE_S:
+                skipped_s += duration
+                held = chunk
+                continue
+        held = None
+        skipped_s = 0.0
+        yield chunk
 
 def list_microphones(pya):
     """Lists available microphone devices."""
@@ -121,7 +274,7 @@ def list_microphones(pya):
             input_devices.append(i)
     return input_devices
 
-def transcribe_streaming_chirp3_mic():
+async def transcribe_streaming_chirp3_mic():
     """Transcribes audio from microphone using Chirp 3."""
     
     # Microphone selection
@@ -147,57 +300,22 @@ def transcribe_streaming_chirp3_mic():
     finally:
         pya.terminate()
 
-    # Instantiates a client
-    client = SpeechClient(
-        client_options=ClientOptions(
-            api_endpoint=f"{REGION}-speech.googleapis.com",
-        )
+    # Instantiates an authenticated channel and a raw StreamingRecognize stub;
+    # requests go out as-is and only responses are deserialized.
+    channel = SpeechGrpcAsyncIOTransport.create_channel(
+        f"{SPEECH_ENDPOINT}:443",
+        options=GRPC_CHANNEL_OPTIONS,
     )
-
-    # Configuration
-    recognition_config = cloud_speech.RecognitionConfig(
-        # IMPORTANT: We must use ExplicitDecodingConfig for raw microphone audio.
-        # AutoDetectDecodingConfig fails because raw PCM (LINEAR16) has no header 
-        # (unlike WAV), so the API cannot auto-detect format and hangs.
-        explicit_decoding_config=cloud_speech.ExplicitDecodingConfig(
-            encoding=cloud_speech.ExplicitDecodingConfig.AudioEncoding.LINEAR16,
-            sample_rate_hertz=SAMPLE_RATE,
-            audio_channel_count=CHANNELS,
-        ),
-        language_codes=["pt-BR"], # Portuguese (Brazil)
-        model="chirp_3",
-    )
-    
-    streaming_config = cloud_speech.StreamingRecognitionConfig(
-        config=recognition_config,
-        streaming_features=cloud_speech.StreamingRecognitionFeatures(
-            # interim_results: Returns partial transcripts (is_final=False) as you speak.
-            # Critical for user feedback so they know the system is listening.
-            interim_results=True, 
-            
-            # enable_voice_activity_events: Returns events when speech starts/ends.
-            enable_voice_activity_events=True,
-            
-            # voice_activity_timeout: SOLVES CHIRP 3 LATENCY ISSUE.
-            # Chirp 3 can be slow to finalize short utterances (like "Tudo").
-            # Setting speech_end_timeout forces the model to finalize the result 
-            # if it detects silence for X seconds (here 2s), preventing 10s+ delays.
-            # We use a dictionary because the VoiceActivityTimeout class might not 
-            # be directly exposed in all library versions.
-            voice_activity_timeout={
-                "speech_end_timeout": {"seconds": 2}
-            }
-        ),
-    )
-
-    config_request = cloud_speech.StreamingRecognizeRequest(
-        recognizer=f"projects/{PROJECT_ID}/locations/{REGION}/recognizers/_",
-        streaming_config=streaming_config,
+    streaming_recognize = channel.stream_stream(
+        STREAMING_RECOGNIZE_METHOD,
+        request_serializer=None,
+        response_deserializer=cloud_speech.StreamingRecognizeResponse.deserialize,
     )
 
-    def requests(config: cloud_speech.StreamingRecognizeRequest, audio: list) -> list:
+    async def requests(config: bytes, audio_chunks):
         yield config
-        yield from audio
+        async for content in audio_chunks:
+            yield encode_audio_request(content)
 
     print(f"\n🎙️  Listening (Chirp 3 - pt-BR)... Press Ctrl+C to stop.")
     print(f"Project: {PROJECT_ID}")
@@ -207,51 +325,50 @@ def transcribe_streaming_chirp3_mic():
         print("Using Default Microphone")
     print("=======================================================\n")
 
-    with MicrophoneStream(SAMPLE_RATE, CHUNK_SIZE, device_index=device_index) as stream:
-        audio_generator = stream.generator()
-        
-        # Generator yielding StreamingRecognizeRequest objects for audio chunks
-        audio_requests = (
-            cloud_speech.StreamingRecognizeRequest(audio=content) 
-            for content in audio_generator
-        )
-
-        try:
-            # Transcribes the audio into text
-            responses = client.streaming_recognize(
-                requests=requests(config_request, audio_requests)
-            )
-            print("Connection established. Waiting for results...")
-
-            # Process responses
-            for response in responses:
-                # print(f"Debug: Response received: {response}") # Uncomment for deep debugging
-                if response.speech_event_type == cloud_speech.StreamingRecognizeResponse.SpeechEventType.SPEECH_ACTIVITY_BEGIN:
-                    print("\r📢 Speech started", end="", flush=True)
-                if response.speech_event_type == cloud_speech.StreamingRecognizeResponse.SpeechEventType.SPEECH_ACTIVITY_END:
-                    print("\r📢 Speech ended", end="", flush=True)
-
-                if not response.results:
-                    continue
-
-                result = response.results[0]
-                if not result.alternatives:
-                    continue
-
-                transcript = result.alternatives[0].transcript
+    # Close the channel on the way out instead of leaving it open for loop teardown
+    async with channel:
+        with MicrophoneStream(SAMPLE_RATE, CHUNK_SIZE, device_index=device_index) as stream:
+            audio_generator = voice_gate(stream.generator())
+
+            try:
+                # Transcribes the audio into text; audio is sent while responses are read
+                responses = streaming_recognize(requests(CONFIG_REQUEST, audio_generator))
+                print("Connection established. Waiting for results...")
+                last_interim_print = 0.0
+
+                # Process responses
+                async for response in responses:
+                    if DEBUG:
+                        print(f"Debug: Response received: {response}")
+                    if response.speech_event_type == cloud_speech.StreamingRecognizeResponse.SpeechEventType.SPEECH_ACTIVITY_BEGIN:
+                        print("\r📢 Speech started", end="", flush=True)
+                    if response.speech_event_type == cloud_speech.StreamingRecognizeResponse.SpeechEventType.SPEECH_ACTIVITY_END:
+                        print("\r📢 Speech ended", end="", flush=True)
+
+                    if not response.results:
+                        continue
+
+                    result = response.results[0]
+                    if not result.alternatives:
+                        continue
+
+                    transcript = result.alternatives[0].transcript
                 
-                # Check if it's a final result or interim
-                if result.is_final:
-                    print(f"\r✅ Final: {transcript}")
-                else:
-                    # Print interim results in place
-                    print(f"\r⏳ Interim: {transcript}", end="", flush=True)
-
-        except Exception as e:
-            print(f"\n❌ Error: {e}")
+                    # Check if it's a final result or interim
+                    if result.is_final:
+                        print(f"\r✅ Final: {transcript}")
+                    else:
+                        # Print interim results in place, at most once per interval
+                        now = time.monotonic()
+                        if now - last_interim_print >= INTERIM_PRINT_INTERVAL_S:
+                            last_interim_print = now
+                            print(f"\r⏳ Interim: {transcript}", end="", flush=True)
+
+            except Exception as e:
+                print(f"\n❌ Error: {e}")
 
 if __name__ == "__main__":
     try:
-        transcribe_streaming_chirp3_mic()
+        asyncio.run(transcribe_streaming_chirp3_mic())
     except KeyboardInterrupt:
         print("\n\n🛑 Stopped by user.")
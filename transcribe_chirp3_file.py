@@ -30,8 +30,8 @@ import threading
 from dotenv import load_dotenv
 
 from google.cloud.speech_v2 import SpeechClient
+from google.cloud.speech_v2.services.speech.transports import SpeechGrpcTransport
 from google.cloud.speech_v2.types import cloud_speech
-from google.api_core.client_options import ClientOptions
 
 # Load environment variables
 load_dotenv()
@@ -41,9 +41,30 @@ REGION = "us"
 if not PROJECT_ID:
     raise ValueError("GOOGLE_CLOUD_PROJECT not found in .env file or environment.")
 
+# gRPC channel tuning for the streaming connection: keepalive pings keep it
+# warm and surface dead links quickly, so final results are not held up.
+SPEECH_ENDPOINT = f"{REGION}-speech.googleapis.com"
+GRPC_CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 10000),
+    ("grpc.keepalive_timeout_ms", 5000),
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.max_receive_message_length", -1),
+]
+
+# Recognition settings that don't depend on the file, built once at import
+RECOGNIZER = f"projects/{PROJECT_ID}/locations/{REGION}/recognizers/_"
+STREAMING_FEATURES = cloud_speech.StreamingRecognitionFeatures(
+    interim_results=True,
+    enable_voice_activity_events=True,
+    voice_activity_timeout={
+        "speech_end_timeout": {"seconds": 2}
+    }
+)
+
 # Audio configuration
 AUDIO_FILE = "teste2.wav"
-CHUNK_SIZE = 1024
+MIN_CHUNK_S = 1.0  # Seconds of audio per streaming request (fewer, larger gRPC messages)
+MAX_CHUNK_BYTES = 25600  # Speech-to-Text V2 limit for the audio in a single request
 
 # Shared state for tracking audio sent
 class AudioTracker:
@@ -58,16 +79,19 @@ class AudioTracker:
 
 tracker = AudioTracker()
 
-def stream_file(file_path, chunk_size):
+def stream_file(file_path, min_chunk_s):
     """Generator that yields audio chunks from a WAV file."""
     with wave.open(file_path, "rb") as wf:
         sample_rate = wf.getframerate()
-        # Calculate how much time one chunk represents in seconds
-        chunk_duration = chunk_size / sample_rate
+        bytes_per_frame = wf.getsampwidth() * wf.getnchannels()
+        # Send min_chunk_s of audio per request, capped at the API's request size limit
+        chunk_size = min(int(sample_rate * min_chunk_s), MAX_CHUNK_BYTES // bytes_per_frame)
         
         data = wf.readframes(chunk_size)
         while len(data) > 0:
             yield data
+            # Calculate how much time this chunk represents in seconds
+            chunk_duration = len(data) / bytes_per_frame / sample_rate
             # Update tracker
             tracker.audio_sent_seconds += chunk_duration
             
@@ -87,14 +111,22 @@ def transcribe_streaming_chirp3_file():
     with wave.open(AUDIO_FILE, "rb") as wf:
         sample_rate = wf.getframerate()
         channels = wf.getnchannels()
+        sample_width = wf.getsampwidth()
         print(f"Audio File: {AUDIO_FILE}")
         print(f"Sample Rate: {sample_rate}, Channels: {channels}")
 
+    # LINEAR16 is declared below, so anything other than 16-bit PCM would be misread
+    if sample_width != 2:
+        print(f"Error: {AUDIO_FILE} must be 16-bit PCM (got {sample_width * 8}-bit).")
+        return
+
     # Instantiates a client
+    channel = SpeechGrpcTransport.create_channel(
+        f"{SPEECH_ENDPOINT}:443",
+        options=GRPC_CHANNEL_OPTIONS,
+    )
     client = SpeechClient(
-        client_options=ClientOptions(
-            api_endpoint=f"{REGION}-speech.googleapis.com",
-        )
+        transport=SpeechGrpcTransport(host=SPEECH_ENDPOINT, channel=channel)
     )
 
     # Configuration
@@ -110,17 +142,11 @@ def transcribe_streaming_chirp3_file():
     
     streaming_config = cloud_speech.StreamingRecognitionConfig(
         config=recognition_config,
-        streaming_features=cloud_speech.StreamingRecognitionFeatures(
-            interim_results=True,
-            enable_voice_activity_events=True,
-            voice_activity_timeout={
-                "speech_end_timeout": {"seconds": 2}
-            }
-        ),
+        streaming_features=STREAMING_FEATURES,
     )
 
     config_request = cloud_speech.StreamingRecognizeRequest(
-        recognizer=f"projects/{PROJECT_ID}/locations/{REGION}/recognizers/_",
+        recognizer=RECOGNIZER,
         streaming_config=streaming_config,
     )
 
@@ -138,7 +164,7 @@ def transcribe_streaming_chirp3_file():
         tracker.start_time = time.time()
         
         # Generator yielding audio chunks
-        audio_generator = stream_file(AUDIO_FILE, CHUNK_SIZE)
+        audio_generator = stream_file(AUDIO_FILE, MIN_CHUNK_S)
 
         # Transcribes the audio into text
         responses = client.streaming_recognize(
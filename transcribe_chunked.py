@@ -25,8 +25,6 @@ Note: This approach has higher latency compared to the Gemini Live API.
 import asyncio
 import pyaudio
 import os
-import io
-import wave
 from dotenv import load_dotenv
 
 from google import genai
@@ -42,10 +40,19 @@ if not PROJECT_ID:
 
 # Audio configuration
 FORMAT = pyaudio.paInt16
+SAMPLE_WIDTH = pyaudio.get_sample_size(FORMAT)  # Bytes per sample
 CHANNELS = 1
 SAMPLE_RATE = 16000  # Sample rate for audio recording
-CHUNK_SIZE = 1024
+# Frames per PortAudio buffer; larger buffers mean fewer callbacks per chunk.
+# Override with STT_CHUNK_SIZE to tune per platform (must be a power of two).
+CHUNK_SIZE = int(os.getenv("STT_CHUNK_SIZE", "2048"))
+if CHUNK_SIZE <= 0 or CHUNK_SIZE & (CHUNK_SIZE - 1):
+    raise ValueError("STT_CHUNK_SIZE must be a power of two")
 CHUNK_DURATION = 5  # Duration of each audio chunk in seconds
+PROCESS_CHUNKS = SAMPLE_RATE * CHUNK_DURATION // CHUNK_SIZE  # PortAudio buffers per chunk
+# Raw 16-bit PCM is sent as-is; no WAV container needed
+AUDIO_MIME_TYPE = f"audio/pcm;rate={SAMPLE_RATE}"
+MAX_PENDING_TRANSCRIPTIONS = 2  # Chunks allowed to wait on the API while recording continues
 
 # Gemini model configuration
 MODEL = "gemini-2.0-flash-exp"
@@ -63,8 +70,8 @@ client = genai.Client(
 # System instruction for the model
 SYSTEM_INSTRUCTION = "act as a live transcriber, only write back what you hear. no explanation and the language is portuguese but could mix english words."
 
-def transcribe_audio_chunk(audio_bytes: bytes) -> str:
-    """Sends an audio chunk (WAV format) to Gemini API and returns transcription."""
+async def transcribe_audio_chunk(audio_bytes: bytes) -> str:
+    """Sends an audio chunk (raw PCM) to Gemini API and returns transcription."""
     try:
         # Prepare the content
         contents = [
@@ -72,21 +79,19 @@ def transcribe_audio_chunk(audio_bytes: bytes) -> str:
                 role="user",
                 parts=[
                     types.Part.from_text(text=SYSTEM_INSTRUCTION),
-                    types.Part.from_bytes(data=audio_bytes, mime_type='audio/wav')
+                    types.Part.from_bytes(data=audio_bytes, mime_type=AUDIO_MIME_TYPE)
                 ],
             ),
         ]
         
-        # Call generate_content
-        response = client.models.generate_content(
+        # Use the asynchronous API client so recording is not blocked
+        response = await client.aio.models.generate_content(
             model=MODEL,
             contents=contents
         )
         
-        # Extract text from the response
-        if response and hasattr(response, 'parts') and response.parts:
-             return "".join(part.text for part in response.parts if hasattr(part, 'text'))
-        elif response and hasattr(response, 'text'):
+        # response.text already joins the text parts of the first candidate
+        if response and response.text:
              return response.text
         else:
              print(f"Warning: No text found in response object or its parts. Response: {response}")
@@ -97,9 +102,38 @@ def transcribe_audio_chunk(audio_bytes: bytes) -> str:
         return "[Transcription Error]"
 
 
+async def print_transcriptions(pending: asyncio.Queue):
+    """Awaits transcription tasks in submission order and prints their results."""
+    while True:
+        task = await pending.get()
+        transcription = await task
+
+        if transcription:
+            print(f"Transcription: {transcription}")
+        else:
+            print("[No transcription received for this chunk]")
+
+
 async def main():
     """Main execution loop for chunk-based transcription."""
     stream = None
+    # Transcription tasks run while the next chunk is recorded; the queue
+    # keeps them in order and bounds how many can pile up.
+    pending = asyncio.Queue(maxsize=MAX_PENDING_TRANSCRIPTIONS)
+    printer = asyncio.create_task(print_transcriptions(pending))
+
+    # PortAudio delivers chunks from its own thread; hand them to the event loop
+    # instead of paying a thread-pool round-trip for every blocking read.
+    loop = asyncio.get_running_loop()
+    audio_queue = asyncio.Queue()
+
+    def fill_queue(in_data, frame_count, time_info, status_flags):
+        if status_flags & pyaudio.paInputOverflow:
+            # None marks an overflow so the partial chunk gets discarded
+            loop.call_soon_threadsafe(audio_queue.put_nowait, None)
+        loop.call_soon_threadsafe(audio_queue.put_nowait, in_data)
+        return None, pyaudio.paContinue
+
     try:
         mic_info = pya.get_default_input_device_info()
         stream = await asyncio.to_thread(
@@ -110,6 +144,7 @@ async def main():
             input=True,
             input_device_index=mic_info["index"],
             frames_per_buffer=CHUNK_SIZE,
+            stream_callback=fill_queue,
         )
 
         print("\n🎙️  Chunk-Based Transcription Started (Gemini 2.0 Flash - Vertex AI)")
@@ -117,53 +152,44 @@ async def main():
         print(f"Recording in {CHUNK_DURATION}-second chunks. Press Ctrl+C to stop.")
         print("==========================================")
 
+        bytes_per_chunk = CHUNK_SIZE * SAMPLE_WIDTH * CHANNELS
+
+        # One contiguous buffer reused for every recording, filled in place
+        buf = bytearray(PROCESS_CHUNKS * bytes_per_chunk)
+        # Bound once instead of resolving the attribute on every chunk
+        get_audio = audio_queue.get
+
         while True:
-            frames = []
+            offset = 0
             print(f"\n[*] Recording {CHUNK_DURATION}-second chunk...")
-            
-            # Calculate number of chunks to read for the desired duration
-            num_chunks_to_read = int(SAMPLE_RATE / CHUNK_SIZE * CHUNK_DURATION)
-            
-            for _ in range(num_chunks_to_read):
-                try:
-                    data = await asyncio.to_thread(stream.read, CHUNK_SIZE, exception_on_overflow=False)
-                    frames.append(data)
-                except IOError as ex:
-                    if ex[1] != pyaudio.paInputOverflowed:
-                        raise
+
+            for _ in range(PROCESS_CHUNKS):
+                data = await get_audio()
+                if data is None:
                     print("Warning: Input overflowed. Skipping chunk.")
                     # Skip this chunk if overflow occurs
-                    frames = [] # Clear frames to avoid processing partial/corrupt data
-                    break 
-            
-            if not frames: # If frames list is empty (due to overflow skip), continue to next iteration
+                    offset = 0 # Drop the recorded audio to avoid processing partial/corrupt data
+                    break
+                end = offset + len(data)
+                buf[offset:end] = data
+                offset = end
+
+            if not offset: # Nothing recorded (due to overflow skip), continue to next iteration
                  continue
 
             print("[*] Recording finished. Transcribing...")
 
-            # Convert raw audio frames to WAV format in memory
-            wav_buffer = io.BytesIO()
-            with wave.open(wav_buffer, 'wb') as wf:
-                wf.setnchannels(CHANNELS)
-                wf.setsampwidth(pya.get_sample_size(FORMAT))
-                wf.setframerate(SAMPLE_RATE)
-                wf.writeframes(b''.join(frames))
-            wav_buffer.seek(0)
-            audio_bytes = wav_buffer.read()
-
-            # Transcribe the chunk (run synchronously for simplicity in the loop)
-            transcription = transcribe_audio_chunk(audio_bytes) 
+            audio_bytes = bytes(memoryview(buf)[:offset])
 
-            if transcription:
-                print(f"Transcription: {transcription}")
-            else:
-                print("[No transcription received for this chunk]")
+            # Transcribe the chunk in the background and start recording the next one
+            await pending.put(asyncio.create_task(transcribe_audio_chunk(audio_bytes)))
 
     except KeyboardInterrupt:
         print("\n\n🛑 Transcription stopped by user.")
     except Exception as e:
         print(f"\n❌ An unexpected error occurred: {e}")
     finally:
+        printer.cancel()
         if stream:
             stream.stop_stream()
             stream.close()
@@ -22,15 +22,25 @@ chunks to the Gemini API for transcription, creating a seamless transcription ex
 
 import asyncio
 import pyaudio
+import numpy as np
 import os
-import io
-import wave
+import sys
 import time
+import heapq
+import random
 from collections import deque
+import httpx
 from dotenv import load_dotenv
 
 from google import genai
-from google.genai import types
+from google.genai import errors, types
+
+# uvloop is optional (not available on Windows); fall back to the default loop
+try:
+    import uvloop
+    LOOP_FACTORY = uvloop.new_event_loop
+except ImportError:
+    LOOP_FACTORY = None
 
 # Load environment variables
 load_dotenv()
@@ -42,11 +52,27 @@ if not PROJECT_ID:
 
 # Audio configuration
 FORMAT = pyaudio.paInt16
+SAMPLE_WIDTH = pyaudio.get_sample_size(FORMAT)  # Bytes per sample
 CHANNELS = 1
 SAMPLE_RATE = 16000  # Sample rate for audio recording
 CHUNK_SIZE = 1024
 CHUNK_DURATION = 5  # Duration of each audio chunk in seconds
 OVERLAP_DURATION = 1  # Overlap between chunks in seconds (to avoid missing words at boundaries)
+OVERLAP_CHUNKS = SAMPLE_RATE * OVERLAP_DURATION // CHUNK_SIZE  # PortAudio buffers between sends
+# Rate sent to Gemini. 8000 would halve uploads, but generate_content is not
+# confirmed to honour ";rate=" on audio/pcm, so audio is sent at the capture rate.
+TARGET_RATE = SAMPLE_RATE
+AUDIO_MIME_TYPE = f"audio/pcm;rate={TARGET_RATE}"
+SILENCE_RMS = 200  # int16 RMS below which a 100 ms frame is treated as silence
+SPEECH_FRAME_BYTES = SAMPLE_RATE // 10 * CHANNELS * SAMPLE_WIDTH  # 100 ms
+MIN_PAYLOAD_BYTES = SAMPLE_RATE * CHANNELS * SAMPLE_WIDTH  # 1 s
+MAX_CONCURRENT_REQUESTS = 2  # Gemini calls allowed in flight at once
+
+# Retry policy for rate-limit and transient server errors (exponential backoff with jitter)
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY_S = 1
+RETRY_MAX_DELAY_S = 30
 
 # Gemini model configuration
 MODEL = "gemini-2.0-flash-exp"
@@ -55,6 +81,44 @@ MODEL = "gemini-2.0-flash-exp"
 SYSTEM_INSTRUCTION = "act as a live transcriber, only write back what you hear. no explanation and the language is portuguese but could mix english words."
 
 
+# Decimation low-pass: 31-tap Hamming-windowed sinc cutting off just below the
+# Nyquist of TARGET_RATE, normalised to unity gain (unused at the capture rate)
+_taps = np.arange(31) - 15
+DECIMATE_FIR = np.sinc(_taps * 0.9 * TARGET_RATE / SAMPLE_RATE) * np.hamming(31)
+DECIMATE_FIR /= DECIMATE_FIR.sum()
+
+
+def _downsample(pcm):
+    """Low-pass and decimate 16-bit PCM from SAMPLE_RATE to TARGET_RATE."""
+    samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+    filtered = np.convolve(samples, DECIMATE_FIR, mode="same")[::SAMPLE_RATE // TARGET_RATE]
+    return np.clip(np.rint(filtered), -32768, 32767).astype(np.int16).tobytes()
+
+
+def _speech_end(pcm):
+    """Return the byte offset where the last 100 ms frame above SILENCE_RMS ends (0 if none)."""
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    frame_samples = SPEECH_FRAME_BYTES // samples.itemsize
+    usable = len(samples) - len(samples) % frame_samples
+    frames = samples[:usable].reshape(-1, frame_samples).astype(np.float32)
+    voiced = np.flatnonzero(np.sqrt(np.mean(np.square(frames), axis=1)) >= SILENCE_RMS)
+    if not voiced.size:
+        return 0
+    return int(voiced[-1] + 1) * SPEECH_FRAME_BYTES
+
+
+# ANSI escapes are used to redraw the screen; an empty os.system() call once at
+# startup turns on escape sequence processing in the Windows 10+ console.
+if os.name == 'nt':
+    os.system('')
+
+DISPLAY_HEADER = (
+    "\n🎙️  Continuous Transcription (Gemini 2.0 Flash - Vertex AI)\n"
+    "====================================================\n"
+    "Recent transcriptions (newest at bottom):\n"
+)
+
+
 class ContinuousTranscriber:
     def __init__(self):
         self.frames_queue = asyncio.Queue()
@@ -62,23 +126,101 @@ class ContinuousTranscriber:
         self.audio_stream = None
         self.pya = pyaudio.PyAudio()
         
-        # Configure Gemini client for Vertex AI (ADC)
+        # Configure Gemini client for Vertex AI (ADC). Requests go out every
+        # second, so multiplex them over one pooled HTTP/2 connection. An explicit
+        # transport keeps the SDK on httpx even when aiohttp is installed.
         self.client = genai.Client(
             vertexai=True,
             project=PROJECT_ID,
-            location=LOCATION
+            location=LOCATION,
+            http_options=types.HttpOptions(
+                async_client_args={
+                    "transport": httpx.AsyncHTTPTransport(
+                        http2=True,
+                        limits=httpx.Limits(
+                            max_connections=MAX_CONCURRENT_REQUESTS,
+                            max_keepalive_connections=MAX_CONCURRENT_REQUESTS,
+                        ),
+                    ),
+                },
+            ),
         )
         
-        # Buffer to store recent audio frames for creating overlapping chunks
-        self.frame_buffer = deque(maxlen=int(SAMPLE_RATE / CHUNK_SIZE * (CHUNK_DURATION + OVERLAP_DURATION)))
+        # Ring buffer holding the most recent audio for creating overlapping chunks
+        bytes_per_second = SAMPLE_RATE * CHANNELS * SAMPLE_WIDTH
+        self._ring = bytearray(bytes_per_second * (CHUNK_DURATION + OVERLAP_DURATION))
+        self._wpos = 0  # Next write position in the ring
+        self._filled = 0  # Bytes of valid audio in the ring
+        self._written = 0  # Total bytes ever written, for absolute stream positions
+        self._last_speech_end = 0  # Stream position where speech in the last successful send ended
+        self._sent_speech_end = 0  # Same, counting requests still in flight
+        self._chunk_bytes = bytes_per_second * CHUNK_DURATION  # Audio sent per request
+        
+        # The instruction part never changes, so it is built once and reused
+        self._text_part = types.Part.from_text(text=SYSTEM_INSTRUCTION)
+        
+        # Bounded API concurrency; results are shown in the order chunks were taken
+        self._api_sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        self._seq = 0  # Sequence number of the next chunk
+        self._inflight = 0  # Transcription tasks not yet finished
+        self._dropped = 0  # Ticks skipped because the API was saturated
+        self._next_out = 0  # Sequence number of the next result to display
+        self._results = []  # Heap of (seq, transcription) waiting for earlier results
         
         # Store recent transcriptions for display
-        self.recent_transcriptions = []
         self.max_recent_transcriptions = 5
+        self.recent_transcriptions = deque(maxlen=self.max_recent_transcriptions)
+
+    def _ring_write(self, data):
+        """Appends audio to the ring buffer, overwriting the oldest bytes."""
+        size = len(self._ring)
+        n = len(data)
+        end = self._wpos + n
+        if end <= size:
+            self._ring[self._wpos:end] = data
+        else:
+            split = size - self._wpos
+            with memoryview(data) as view:
+                self._ring[self._wpos:] = view[:split]
+                self._ring[:n - split] = view[split:]
+        self._wpos = end % size
+        self._filled = min(self._filled + n, size)
+        self._written += n
+
+    def _ring_tail(self):
+        """Return the most recent CHUNK_DURATION seconds of audio as bytes."""
+        size = len(self._ring)
+        n = self._chunk_bytes
+        start = (self._wpos - n) % size
+        # A single copy out of the ring; a wrapped tail is joined from two views
+        with memoryview(self._ring) as ring:
+            if start + n <= size:
+                return bytes(ring[start:start + n])
+            return b"".join((ring[start:], ring[:start + n - size]))
+
+    def _pa_callback(self, in_data, frame_count, time_info, status_flags):
+        """PortAudio callback (audio thread): hand the buffer over to the event loop."""
+        self._loop.call_soon_threadsafe(self._on_audio, in_data, status_flags)
+        return None, pyaudio.paContinue
+
+    def _on_audio(self, data, status_flags):
+        """Store captured audio and signal processing every OVERLAP_DURATION seconds."""
+        if status_flags & pyaudio.paInputOverflow:
+            print("Warning: Input overflowed.")
+        self._ring_write(data)
+        
+        self._chunk_counter += 1
+        if self._chunk_counter >= OVERLAP_CHUNKS:
+            # Put a marker in the queue to signal processing
+            self.frames_queue.put_nowait("process")
+            self._chunk_counter = 0
 
     async def record_audio(self):
         """Continuously record audio and add frames to the buffer and queue."""
         try:
+            self._chunk_counter = 0
+            self._loop = asyncio.get_running_loop()
+            
             mic_info = self.pya.get_default_input_device_info()
             self.audio_stream = await asyncio.to_thread(
                 self.pya.open,
@@ -88,30 +230,13 @@ class ContinuousTranscriber:
                 input=True,
                 input_device_index=mic_info["index"],
                 frames_per_buffer=CHUNK_SIZE,
+                stream_callback=self._pa_callback,
             )
             
             print("\n🎤 Recording started. Press Ctrl+C to stop.")
             
-            # Calculate how many chunks to collect before starting to process
-            chunks_per_processing = int(SAMPLE_RATE / CHUNK_SIZE * OVERLAP_DURATION)
-            chunk_counter = 0
-            
-            while self.is_running:
-                try:
-                    data = await asyncio.to_thread(self.audio_stream.read, CHUNK_SIZE, exception_on_overflow=False)
-                    self.frame_buffer.append(data)
-                    
-                    # Every OVERLAP_DURATION seconds, signal that we have enough data to process
-                    chunk_counter += 1
-                    if chunk_counter >= chunks_per_processing:
-                        # Put a marker in the queue to signal processing
-                        await self.frames_queue.put("process")
-                        chunk_counter = 0
-                        
-                except IOError as ex:
-                    if getattr(ex, 'errno', None) != pyaudio.paInputOverflowed:
-                        raise
-                    print("Warning: Input overflowed.")
+            # Audio now arrives through the callback; stay alive until cancelled
+            await asyncio.Event().wait()
                     
         except asyncio.CancelledError:
             pass
@@ -129,75 +254,115 @@ class ContinuousTranscriber:
                 # Wait for a signal to process
                 signal = await self.frames_queue.get()
                 
-                if signal == "process" and len(self.frame_buffer) >= int(SAMPLE_RATE / CHUNK_SIZE * CHUNK_DURATION):
-                    # Create a copy of the current buffer for processing
-                    frames_to_process = list(self.frame_buffer)[-int(SAMPLE_RATE / CHUNK_SIZE * CHUNK_DURATION):]
+                if signal == "process" and self._filled >= self._chunk_bytes:
+                    # The API can't keep up; skip this tick rather than queue more work
+                    # (the running count is shown in the display footer)
+                    if self._inflight >= MAX_CONCURRENT_REQUESTS:
+                        self._dropped += 1
+                        continue
+                    
+                    # Copy the latest CHUNK_DURATION seconds out of the ring for processing
+                    tail = self._ring_tail()
                     
-                    # Convert frames to WAV format
-                    wav_buffer = io.BytesIO()
-                    with wave.open(wav_buffer, 'wb') as wf:
-                        wf.setnchannels(CHANNELS)
-                        wf.setsampwidth(self.pya.get_sample_size(FORMAT))
-                        wf.setframerate(SAMPLE_RATE)
-                        wf.writeframes(b''.join(frames_to_process))
-                    wav_buffer.seek(0)
-                    audio_bytes = wav_buffer.read()
+                    # Don't spend an API call on a chunk with no speech energy, or
+                    # whose speech all ended before the previous chunk's did
+                    end = _speech_end(tail)
+                    if not end:
+                        continue
+                    speech_end = self._written - len(tail) + end
+                    if speech_end <= self._sent_speech_end:
+                        continue
+                    self._sent_speech_end = speech_end
                     
-                    # Process in a separate task to avoid blocking
-                    asyncio.create_task(self.transcribe_and_display(audio_bytes))
+                    # Send only up to the end of speech (at least 1 s) so the model
+                    # doesn't process trailing silence
+                    payload = tail[:max(end, MIN_PAYLOAD_BYTES)]
+                    if TARGET_RATE != SAMPLE_RATE:
+                        payload = _downsample(payload)
+                    
+                    # Process in a separate task to avoid blocking; raw PCM is sent
+                    seq = self._seq
+                    self._seq += 1
+                    self._inflight += 1
+                    asyncio.create_task(self.transcribe_and_display(payload, seq, speech_end))
                 
         except asyncio.CancelledError:
             pass
         except Exception as e:
             print(f"\n❌ Error in audio processing: {e}")
 
-    async def transcribe_and_display(self, audio_bytes):
+    async def _call_with_backoff(self, contents):
+        """Call generate_content, retrying 429/5xx errors with exponential backoff."""
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                return await self.client.aio.models.generate_content(
+                    model=MODEL,
+                    contents=contents
+                )
+            except errors.APIError as e:
+                if e.code not in RETRYABLE_STATUS_CODES or attempt == MAX_ATTEMPTS - 1:
+                    raise
+                delay = min(RETRY_MAX_DELAY_S, RETRY_BASE_DELAY_S * 2 ** attempt) + random.random()
+                print(f"\n⚠️  API error {e.code}, retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+
+    async def transcribe_and_display(self, audio_bytes, seq, speech_end):
         """Send audio to API and display transcription."""
+        transcription = ""
         try:
             # Prepare the content
             contents = [
                 types.Content(
                     role="user",
                     parts=[
-                        types.Part.from_text(text=SYSTEM_INSTRUCTION),
-                        types.Part.from_bytes(data=audio_bytes, mime_type='audio/wav')
+                        self._text_part,
+                        types.Part.from_bytes(data=audio_bytes, mime_type=AUDIO_MIME_TYPE)
                     ],
                 ),
             ]
             
-            # Use the asynchronous API client
-            response = await self.client.aio.models.generate_content(
-                model=MODEL,
-                contents=contents
-            )
+            # Use the asynchronous API client, limiting how many calls run at once
+            async with self._api_sem:
+                response = await self._call_with_backoff(contents)
+            self._last_speech_end = max(self._last_speech_end, speech_end)
+            self._sent_speech_end = max(self._sent_speech_end, self._last_speech_end)
             
             # Extract text from response
-            transcription = ""
             if response and hasattr(response, 'parts') and response.parts:
                 transcription = "".join(part.text for part in response.parts if hasattr(part, 'text'))
             elif response and hasattr(response, 'text'):
                 transcription = response.text
-                
-            if transcription:
-                # Add timestamp and store in recent transcriptions
-                timestamp = time.strftime("%H:%M:%S")
-                self.recent_transcriptions.append(f"[{timestamp}] {transcription}")
-                
-                # Keep only the most recent transcriptions
-                if len(self.recent_transcriptions) > self.max_recent_transcriptions:
-                    self.recent_transcriptions.pop(0)
-                
-                # Display all recent transcriptions
-                os.system('cls' if os.name == 'nt' else 'clear')
-                print("\n🎙️  Continuous Transcription (Gemini 2.0 Flash - Vertex AI)")
-                print("====================================================")
-                print("Recent transcriptions (newest at bottom):")
-                for t in self.recent_transcriptions:
-                    print(t)
-                print("\nRecording... Press Ctrl+C to stop.")
             
         except Exception as e:
             print(f"\n❌ Error during transcription: {e}")
+            # Roll back so the next tick resends speech no request delivered
+            self._sent_speech_end = self._last_speech_end
+        finally:
+            self._inflight -= 1
+        
+        # Release results strictly in sequence order; failed chunks still take their turn
+        heapq.heappush(self._results, (seq, transcription))
+        while self._results and self._results[0][0] == self._next_out:
+            _, transcription = heapq.heappop(self._results)
+            self._next_out += 1
+            if transcription:
+                self.display(transcription)
+
+    def display(self, transcription):
+        """Store a transcription and redraw the recent transcriptions."""
+        # Add timestamp and store in recent transcriptions
+        timestamp = time.strftime("%H:%M:%S")
+        self.recent_transcriptions.append(f"[{timestamp}] {transcription}")
+        
+        # Redraw the whole screen (ANSI home + clear) in a single write; the deque
+        # already dropped the oldest entry
+        out = "\x1b[H\x1b[2J" + DISPLAY_HEADER
+        out += "\n".join(self.recent_transcriptions)
+        out += "\n\nRecording... Press Ctrl+C to stop.\n"
+        if self._dropped:
+            out += f"⚠️  {self._dropped} chunk(s) skipped while the API was busy\n"
+        sys.stdout.write(out)
+        sys.stdout.flush()
 
     async def run(self):
         """Main execution method."""
@@ -229,7 +394,8 @@ async def main():
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        with asyncio.Runner(loop_factory=LOOP_FACTORY) as runner:
+            runner.run(main())
     except KeyboardInterrupt:
         print("\n\n🛑 Transcription stopped by user.")
     finally:
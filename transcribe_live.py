@@ -23,11 +23,19 @@ transcription using Google's Gemini Live API via Vertex AI (ADC).
 import asyncio
 import pyaudio
 import os
+import signal
 from dotenv import load_dotenv
 
 from google import genai
 from google.genai import types
 
+# uvloop is optional (not available on Windows); fall back to the default loop
+try:
+    import uvloop
+    LOOP_FACTORY = uvloop.new_event_loop
+except ImportError:
+    LOOP_FACTORY = None
+
 # Load environment variables
 load_dotenv()
 PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT")
@@ -41,6 +49,8 @@ FORMAT = pyaudio.paInt16
 CHANNELS = 1
 SAMPLE_RATE = 16000
 CHUNK_SIZE = 1024
+SEND_BATCH_MS = 200  # Audio coalesced into each session.send call
+SEND_BATCH_BYTES = SAMPLE_RATE * SEND_BATCH_MS // 1000 * CHANNELS * pyaudio.get_sample_size(FORMAT)
 
 # Gemini model configuration
 MODEL = "gemini-2.5-flash"
@@ -64,14 +74,22 @@ CONFIG = types.LiveConnectConfig(
 
 class TranscriptionLoop:
     def __init__(self):
-        self.out_queue = None
+        self.audio_queue = None
         self.session = None
         self.audio_stream = None
         self.transcription = ""
         self.is_running = True
 
+    def _pa_callback(self, in_data, frame_count, time_info, status_flags):
+        """PortAudio callback (audio thread): hand the buffer over to the event loop."""
+        self._loop.call_soon_threadsafe(self.audio_queue.put_nowait, in_data)
+        return None, pyaudio.paContinue
+
     async def listen_audio(self):
-        """Capture audio from microphone and send to queue"""
+        """Capture audio from microphone and send it to Gemini"""
+        self._loop = asyncio.get_running_loop()
+        self.audio_queue = asyncio.Queue()
+        
         mic_info = pya.get_default_input_device_info()
         self.audio_stream = await asyncio.to_thread(
             pya.open,
@@ -81,34 +99,29 @@ class TranscriptionLoop:
             input=True,
             input_device_index=mic_info["index"],
             frames_per_buffer=CHUNK_SIZE,
+            stream_callback=self._pa_callback,
         )
         
         print("\n🎤 Listening... (Press Ctrl+C to stop)\n")
-        
-        if __debug__:
-            kwargs = {"exception_on_overflow": False}
-        else:
-            kwargs = {}
             
+        # Chunks arrive at a fixed cadence, so a byte threshold is also a time threshold
+        buf = bytearray()
         try:
             while self.is_running:
-                data = await asyncio.to_thread(self.audio_stream.read, CHUNK_SIZE, **kwargs)
-                await self.out_queue.put({"data": data, "mime_type": "audio/pcm"})
+                buf += await self.audio_queue.get()
+                if len(buf) >= SEND_BATCH_BYTES:
+                    try:
+                        await self.session.send(input={"data": bytes(buf), "mime_type": "audio/pcm"})
+                    except Exception as e:
+                        # A failed send drops this batch; keep capturing
+                        print(f"\n⚠️ Send error: {e}")
+                    buf.clear()
         except asyncio.CancelledError:
             pass
         finally:
             if self.audio_stream:
                 self.audio_stream.close()
 
-    async def send_realtime(self):
-        """Send audio data to Gemini API"""
-        try:
-            while self.is_running:
-                msg = await self.out_queue.get()
-                await self.session.send(input=msg)
-        except asyncio.CancelledError:
-            pass
-
     async def receive_transcription(self):
         """Receive and display transcription from Gemini API"""
         try:
@@ -122,15 +135,10 @@ class TranscriptionLoop:
         except asyncio.CancelledError:
             pass
 
-    async def check_for_exit(self):
-        """Check for user exit command"""
-        try:
-            while self.is_running:
-                await asyncio.sleep(0.1)  # Small delay to prevent CPU hogging
-        except asyncio.CancelledError:
-            self.is_running = False
-        except KeyboardInterrupt:
-            self.is_running = False
+    def _request_stop(self):
+        """Signal handler: stop the loop and unwind the session"""
+        self.is_running = False
+        self._main_task.cancel()
 
     async def run(self):
         """Main execution loop"""
@@ -139,16 +147,23 @@ class TranscriptionLoop:
         print(f"Project: {PROJECT_ID}")
         print("This app will transcribe your speech in real-time.")
         
+        # Stop on Ctrl+C / SIGTERM without a polling task. add_signal_handler is
+        # unavailable on Windows, where Ctrl+C still cancels via the Runner.
+        self._main_task = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._request_stop)
+            except NotImplementedError:
+                pass
+        
         try:
             async with client.aio.live.connect(model=MODEL, config=CONFIG) as session:
                 self.session = session
-                self.out_queue = asyncio.Queue(maxsize=5)
                 
                 async with asyncio.TaskGroup() as tg:
                     tg.create_task(self.listen_audio())
-                    tg.create_task(self.send_realtime())
                     tg.create_task(self.receive_transcription())
-                    tg.create_task(self.check_for_exit())
                     
         except asyncio.CancelledError:
             pass
@@ -169,7 +184,8 @@ class TranscriptionLoop:
 if __name__ == "__main__":
     try:
         transcription = TranscriptionLoop()
-        asyncio.run(transcription.run())
+        with asyncio.Runner(loop_factory=LOOP_FACTORY) as runner:
+            runner.run(transcription.run())
     except KeyboardInterrupt:
         print("\n\n🛑 Transcription stopped by user.")
     finally: